@@ -1,46 +1,148 @@
 from __future__ import annotations
+import csv
+import datetime as dt
+import re
+from itertools import islice
 import pandas as pd
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
-from .models import Base, StoreStatus, BusinessHours, StoreTimeZone
+from sqlalchemy import create_engine, event, inspect, make_url, select, union
+from sqlalchemy.pool import StaticPool
+from .models import Base, Report, Store, StoreStatus, BusinessHours, StoreTimeZone
 
 def get_engine(db_path: str = "sqlite:///storemon.db"):
-    return create_engine(db_path, future=True)
+    url = make_url(db_path)
+    kwargs = {}
+    if url.get_backend_name() == "sqlite":
+        # Connections are handed between the event loop's threadpool and the report worker thread.
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # An in-memory DB lives and dies with its connection, so every session must share one.
+            kwargs["poolclass"] = StaticPool
+    engine = create_engine(db_path, future=True, insertmanyvalues_page_size=10_000, **kwargs)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",      # readers don't block the writer
+    "PRAGMA synchronous=NORMAL",    # fsync at checkpoints only; much cheaper bulk-ingest commits
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",   # 256 MiB memory-mapped reads
+    "PRAGMA cache_size=-65536",     # 64 MiB page cache (negative = KiB)
+)
+
+def _set_sqlite_pragmas(dbapi_conn, _conn_record):
+    cur = dbapi_conn.cursor()
+    for pragma in _SQLITE_PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
 
 def init_db(engine):
     Base.metadata.create_all(engine)
 
+INSERT_CHUNK_ROWS = 10_000
+
+def _register_stores(conn, store_ids) -> None:
+    """Add any store ids not yet in the stores table."""
+    new_ids = set(store_ids) - set(conn.execute(select(Store.store_id)).scalars())
+    if new_ids:
+        conn.execute(Store.__table__.insert(), [{"store_id": sid} for sid in sorted(new_ids)])
+
+def backfill_stores(engine) -> None:
+    """Populate an empty stores table from existing data (databases ingested before it existed)."""
+    with engine.begin() as conn:
+        if conn.execute(select(Store.store_id).limit(1)).first():
+            return
+        stmt = union(
+            select(StoreStatus.store_id).distinct(),
+            select(BusinessHours.store_id).distinct(),
+            select(StoreTimeZone.store_id).distinct(),
+        )
+        _register_stores(conn, conn.execute(stmt).scalars())
+
+# Indexes that replaced older ones on store_status; create_all never touches an existing table.
+_STALE_INDEXES = ("ix_store_ts", "ix_store_status_store_id")
+
+def upgrade_schema(engine) -> None:
+    """Bring databases created by earlier versions up to the current models."""
+    with engine.begin() as conn:
+        for name in _STALE_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+        for index in StoreStatus.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+        reports = Report.__table__
+        have = {c["name"] for c in inspect(conn).get_columns(reports.name)}
+        for col in reports.columns:
+            if col.name not in have and col.nullable:
+                col_type = col.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {reports.name} ADD COLUMN {col.name} {col_type}")
+
+def _append(df: pd.DataFrame, table, engine):
+    # Columns must already match the ORM table; to_sql emits multi-row VALUES inserts.
+    cols = [c.name for c in table.columns if c.name != "id"]
+    df[cols].to_sql(table.name, engine, if_exists="append", index=False, method="multi", chunksize=1000)
+
+_FRACTION = re.compile(r"\.(\d+)")
+
+def _parse_utc(ts: str) -> dt.datetime:
+    """'2024-10-03 23:33:20.412748 UTC' / '...Z' / '...+00:00' -> aware UTC datetime."""
+    ts = ts.strip()
+    if ts.endswith(" UTC"):
+        ts = ts[:-4]
+    # fromisoformat before 3.11 only takes 3- or 6-digit fractions; the feed has e.g. ".15508".
+    ts = _FRACTION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), ts, count=1)
+    parsed = dt.datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=dt.timezone.utc)
+    return parsed.astimezone(dt.timezone.utc)
+
 def ingest_store_status(csv_path: str, engine):
-    df = pd.read_csv(csv_path)
-    df.columns = [c.strip() for c in df.columns]
-    df["timestamp_utc"] = pd.to_datetime(df["timestamp_utc"], utc=True)
-    df["status"] = df["status"].str.lower().str.strip()
-    with Session(engine) as sess, sess.begin():
-        for row in df.itertuples(index=False):
-            sess.add(StoreStatus(
-                store_id=str(getattr(row, "store_id")),
-                timestamp_utc=getattr(row, "timestamp_utc").to_pydatetime(),
-                status=str(getattr(row, "status"))
-            ))
+    # Plain csv.reader -> executemany in fixed-size chunks: no DataFrame, constant memory.
+    init_db(engine)
+    table = StoreStatus.__table__
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        header = [c.strip() for c in next(reader, [])]
+        if not header:
+            return
+        i_sid = header.index("store_id")
+        i_ts = header.index("timestamp_utc")
+        i_st = header.index("status")
+        rows = (
+            {
+                "store_id": row[i_sid].strip(),
+                "timestamp_utc": _parse_utc(row[i_ts]),
+                "status": row[i_st].strip().lower(),
+            }
+            for row in reader if row
+        )
+        seen = set()
+        with engine.begin() as conn:
+            while chunk := list(islice(rows, INSERT_CHUNK_ROWS)):
+                conn.execute(table.insert(), chunk)
+                seen.update(r["store_id"] for r in chunk)
+            _register_stores(conn, seen)
 
 def ingest_business_hours(csv_path: str, engine):
-    df = pd.read_csv(csv_path)
+    init_db(engine)
+    # store_id as text, as ingest_store_status reads it: "007" must not become 7.
+    df = pd.read_csv(csv_path, dtype={"store_id": str})
     df.columns = [c.strip() for c in df.columns]
-    with Session(engine) as sess, sess.begin():
-        for row in df.itertuples(index=False):
-            sess.add(BusinessHours(
-                store_id=str(getattr(row, "store_id")),
-                day_of_week=int(getattr(row, "dayOfWeek")),
-                start_time_local=str(getattr(row, "start_time_local")),
-                end_time_local=str(getattr(row, "end_time_local")),
-            ))
+    df = df.rename(columns={"dayOfWeek": "day_of_week"})
+    df["store_id"] = df["store_id"].str.strip()
+    df["day_of_week"] = df["day_of_week"].astype(int)
+    df["start_time_local"] = df["start_time_local"].astype(str)
+    df["end_time_local"] = df["end_time_local"].astype(str)
+    _append(df, BusinessHours.__table__, engine)
+    with engine.begin() as conn:
+        _register_stores(conn, df["store_id"].unique())
 
 def ingest_store_timezones(csv_path: str, engine):
-    df = pd.read_csv(csv_path)
+    init_db(engine)
+    df = pd.read_csv(csv_path, dtype={"store_id": str})
     df.columns = [c.strip() for c in df.columns]
-    with Session(engine) as sess, sess.begin():
-        for row in df.itertuples(index=False):
-            sess.add(StoreTimeZone(
-                store_id=str(getattr(row, "store_id")),
-                timezone_str=str(getattr(row, "timezone_str")),
-            ))
+    df["store_id"] = df["store_id"].str.strip()
+    df["timezone_str"] = df["timezone_str"].astype(str)
+    _append(df, StoreTimeZone.__table__, engine)
+    with engine.begin() as conn:
+        _register_stores(conn, df["store_id"].unique())
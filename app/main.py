@@ -1,33 +1,69 @@
 from __future__ import annotations
 
 import os
-import csv
+import asyncio
+import logging
 import datetime as dt
+from contextlib import asynccontextmanager
 from uuid import uuid4
 
-from fastapi import FastAPI, Query, HTTPException
+import pandas as pd
+
+from fastapi import FastAPI, Query, HTTPException, Request
 from fastapi.responses import FileResponse, HTMLResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import or_, select, update
 
-from .models import Base, Report, StoreStatus, BusinessHours, StoreTimeZone
+from .models import Base, Report, Store, StoreStatus, BusinessHours, StoreTimeZone
 from .schemas import TriggerResp, ReportStatusResp
 from .ingestion import (
-    get_engine, init_db,
+    get_engine, init_db, upgrade_schema, backfill_stores,
     ingest_store_status, ingest_business_hours, ingest_store_timezones
 )
-from .report_logic import compute_store_metrics
+from .report_logic import compute_report_frame
 
 # ----------------- Config via env -----------------
 DB_URL     = os.environ.get("STOREMON_DB_URL", "sqlite:///storemon.db")
 DATA_DIR   = os.environ.get("STOREMON_DATA_DIR", "sample_data")
 REPORT_DIR = os.environ.get("STOREMON_REPORT_DIR", "reports")
+# A Running report older than this is taken to belong to a dead process and is re-queued.
+STALE_RUNNING_SECONDS = int(os.environ.get("STOREMON_STALE_RUNNING_SECONDS", "1800"))
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reports flow through one in-process queue drained by a single worker. The Reports
+    # table is the durable record: Queued rows left by earlier processes go back on the
+    # queue at startup, and so do Running rows stale enough that their owner must be gone.
+    # Several processes may enqueue the same id; _claim lets exactly one of them run it.
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=STALE_RUNNING_SECONDS)
+    with Session(engine) as sess, sess.begin():
+        sess.execute(
+            update(Report)
+            .where(Report.status == "Running")
+            .where(or_(Report.started_at.is_(None), Report.started_at < cutoff))
+            .values(status="Queued")
+        )
+        pending = sess.execute(
+            select(Report.report_id)
+            .where(Report.status == "Queued")
+            .order_by(Report.created_at.asc())
+        ).scalars().all()
+    for report_id in pending:
+        queue.put_nowait(report_id)
+    app.state.report_queue = queue
+    worker = asyncio.create_task(_report_worker(queue))
+    yield
+    worker.cancel()
 
-app = FastAPI(title="Store Monitoring")
+app = FastAPI(title="Store Monitoring", lifespan=lifespan)
 
 # ----------------- DB init -----------------
 engine = get_engine(DB_URL)
 init_db(engine)
+upgrade_schema(engine)
 
 def ensure_ingested_once() -> None:
     """If DB is empty, ingest from CSVs in DATA_DIR once."""
@@ -48,6 +84,7 @@ def ensure_ingested_once() -> None:
 
 # Call once at import-time (process start)
 ensure_ingested_once()
+backfill_stores(engine)
 
 # ----------------- Health endpoint -----------------
 @app.get("/health")
@@ -55,9 +92,8 @@ def health():
     return {"ok": True}
 
 # ----------------- Preview UI at "/" -----------------
-@app.get("/", response_class=HTMLResponse)
-def preview_home():
-    return """
+# Static page: encode it once and hand back the same response on every GET.
+_PREVIEW_HTML = """
 <!doctype html>
 <html>
 <head>
@@ -115,7 +151,7 @@ def preview_home():
         rid.textContent = data.report_id;
         ridWrap.style.display = "block";
         msg.textContent = "Triggered. Polling status…";
-        st.textContent = "Running"; st.className = "warn";
+        st.textContent = "Queued"; st.className = "warn";
         stWrap.style.display = "block";
         poll(data.report_id);
       } catch (e) {
@@ -140,6 +176,11 @@ def preview_home():
             dlWrap.style.display = "block";
             msg.textContent = "Done. Click “Download CSV”.";
             genBtn.disabled = false;
+          } else if(s.status.startsWith("Error")){
+            st.className = "warn";
+            clearInterval(timer);
+            msg.textContent = s.status;
+            genBtn.disabled = false;
           }
         }catch(e){
           clearInterval(timer);
@@ -151,17 +192,49 @@ def preview_home():
   </script>
 </body>
 </html>
-    """
+"""
+_PREVIEW_RESPONSE = HTMLResponse(
+    content=_PREVIEW_HTML.encode("utf-8"),
+    headers={"Cache-Control": "public, max-age=3600"},
+)
+
+@app.get("/", response_class=HTMLResponse)
+def preview_home():
+    return _PREVIEW_RESPONSE
 
 # ----------------- API endpoints -----------------
 @app.post("/trigger_report", response_model=TriggerResp)
-def trigger_report():
+async def trigger_report(request: Request):
     report_id = str(uuid4())
+    # The insert is a blocking DB write; keep it off the event loop.
+    await asyncio.to_thread(_insert_queued, report_id)
+
+    # Respond right away; the UI polls /get_report until the worker marks it Complete.
+    await request.app.state.report_queue.put(report_id)
+    return TriggerResp(report_id=report_id)
+
+def _insert_queued(report_id: str) -> None:
     created_at = dt.datetime.now(dt.timezone.utc)
     with Session(engine) as sess, sess.begin():
-        r = Report(report_id=report_id, status="Running", created_at=created_at)
-        sess.add(r)
+        sess.add(Report(report_id=report_id, status="Queued", created_at=created_at))
 
+async def _report_worker(queue: asyncio.Queue[str]) -> None:
+    while True:
+        report_id = await queue.get()
+        try:
+            # Off the event loop so status polls stay responsive while the report builds.
+            await asyncio.to_thread(_run_and_mark, report_id)
+        except Exception:
+            # The claim or the Error write itself failed; the row stays Queued/Running for
+            # a later restart to pick up. Keep draining the queue.
+            logger.exception("report worker: job %s crashed", report_id)
+        finally:
+            queue.task_done()
+
+def _run_and_mark(report_id: str) -> None:
+    """Generate the report and record each status transition on its Report row."""
+    if not _claim(report_id):
+        return  # another process (or an earlier queue entry) already took it
     try:
         path = run_report(report_id)
         with Session(engine) as sess, sess.begin():
@@ -170,12 +243,23 @@ def trigger_report():
             r.finished_at = dt.datetime.now(dt.timezone.utc)
             r.path = path
     except Exception as e:
-        with Session(engine) as sess, sess.begin():
-            r = sess.execute(select(Report).where(Report.report_id == report_id)).scalar_one()
-            r.status = f"Error: {e}"
-        raise
+        logger.exception("report %s failed", report_id)
+        _set_status(report_id, f"Error: {e}")
 
-    return TriggerResp(report_id=report_id)
+def _claim(report_id: str) -> bool:
+    """Queued -> Running in one UPDATE; False if the report was not Queued any more."""
+    with Session(engine) as sess, sess.begin():
+        res = sess.execute(
+            update(Report)
+            .where(Report.report_id == report_id, Report.status == "Queued")
+            .values(status="Running", started_at=dt.datetime.now(dt.timezone.utc))
+        )
+    return res.rowcount == 1
+
+def _set_status(report_id: str, status: str) -> None:
+    with Session(engine) as sess, sess.begin():
+        r = sess.execute(select(Report).where(Report.report_id == report_id)).scalar_one()
+        r.status = status
 
 @app.get("/get_report", response_model=ReportStatusResp)
 def get_report(report_id: str = Query(...)):
@@ -201,26 +285,30 @@ def run_report(report_id: str) -> str:
     os.makedirs(REPORT_DIR, exist_ok=True)
     out_path = os.path.join(REPORT_DIR, f"{report_id}.csv")
 
-    rows = []
+    # Maintained at ingest time, so this is O(stores) rather than a scan of store_status.
     with Session(engine) as sess:
-        store_ids = set(i[0] for i in sess.execute(select(StoreStatus.store_id).distinct()).all())
-        store_ids |= set(i[0] for i in sess.execute(select(BusinessHours.store_id).distinct()).all())
-        store_ids |= set(i[0] for i in sess.execute(select(StoreTimeZone.store_id).distinct()).all())
-
-        for sid in sorted(store_ids, key=lambda x: str(x)):
-            metrics = compute_store_metrics(sess, sid)
-            rows.append(metrics)
-
-    cols = [
-        "store_id",
-        "uptime_last_hour_minutes", "uptime_last_day_hours", "uptime_last_week_hours",
-        "downtime_last_hour_minutes", "downtime_last_day_hours", "downtime_last_week_hours",
-    ]
-
-    with open(out_path, "w", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=cols)
-        w.writeheader()
-        for r in rows:
-            w.writerow({k: r.get(k, 0) for k in cols})
+        store_ids = sess.execute(select(Store.store_id)).scalars().all()
+
+    # One read per table instead of ~4 queries per store.
+    status_df = pd.read_sql(
+        select(StoreStatus.store_id, StoreStatus.timestamp_utc, StoreStatus.status)
+        .order_by(StoreStatus.timestamp_utc.asc(), StoreStatus.id.asc()),  # ties: insertion order
+        engine,
+    )
+    bh_df = pd.read_sql(
+        select(BusinessHours.store_id, BusinessHours.day_of_week,
+               BusinessHours.start_time_local, BusinessHours.end_time_local),
+        engine,
+    )
+    tz_df = pd.read_sql(select(StoreTimeZone.store_id, StoreTimeZone.timezone_str), engine)
+
+    # SQLite hands back naive datetimes; ingestion stores them as UTC.
+    status_df["timestamp_utc"] = pd.to_datetime(status_df["timestamp_utc"], utc=True)
+    if len(status_df):
+        now = status_df["timestamp_utc"].max().to_pydatetime()
+    else:
+        now = dt.datetime.now(dt.timezone.utc)
 
+    report = compute_report_frame(status_df, bh_df, tz_df, store_ids, now)
+    report.to_csv(out_path, index=False, lineterminator="\r\n")  # same CRLF rows csv.writer produced
     return out_path
@@ -4,14 +4,20 @@ from sqlalchemy import Integer, String, DateTime, Text, Index
 import datetime as dt
 Base = declarative_base()
 
+class Store(Base):
+    # One row per store id seen by any ingest; lets reports list stores in O(stores).
+    __tablename__ = "stores"
+    store_id: Mapped[str] = mapped_column(String, primary_key=True)
+
 class StoreStatus(Base):
     __tablename__ = "store_status"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    store_id: Mapped[str] = mapped_column(String, index=True)
+    store_id: Mapped[str] = mapped_column(String)  # leading column of ix_store_ts_status
     timestamp_utc: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), index=True)
     status: Mapped[str] = mapped_column(String)  # "active" or "inactive"
     __table_args__ = (
-        Index("ix_store_ts", "store_id", "timestamp_utc"),
+        # Covers per-store (timestamp_utc, status) reads without touching the table.
+        Index("ix_store_ts_status", "store_id", "timestamp_utc", "status"),
     )
 
 class BusinessHours(Base):
@@ -34,5 +40,6 @@ class Report(Base):
     report_id: Mapped[str] = mapped_column(String, index=True, unique=True)
     status: Mapped[str] = mapped_column(String, default="Running")
     created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True))
+    started_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     finished_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     path: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -1,14 +1,25 @@
 from __future__ import annotations
+from functools import lru_cache
 from typing import Dict, List, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func
 import datetime as dt
-import pytz
+import numpy as np
+import pandas as pd
+from zoneinfo import ZoneInfo
 from .models import StoreStatus, BusinessHours, StoreTimeZone
-from .utils_time import Interval, local_business_intervals_utc
+from .utils_time import (
+    Interval, local_business_intervals_utc, intervals_to_arrays, to_epoch_ns
+)
 
 DEFAULT_TZ = "America/Chicago"
 
+REPORT_COLUMNS = (
+    "store_id",
+    "uptime_last_hour_minutes", "uptime_last_day_hours", "uptime_last_week_hours",
+    "downtime_last_hour_minutes", "downtime_last_day_hours", "downtime_last_week_hours",
+)
+
 def _parse_hhmmss(s: str) -> dt.time:
     parts = [int(p) for p in s.split(":")]
     return dt.time(parts[0], parts[1], parts[2] if len(parts) > 2 else 0)
@@ -17,7 +28,9 @@ def get_now(sess: Session) -> dt.datetime:
     max_ts = sess.execute(select(func.max(StoreStatus.timestamp_utc))).scalar_one_or_none()
     if max_ts is None:
         return dt.datetime.now(dt.timezone.utc)
-    return max_ts.astimezone(dt.timezone.utc)
+    if max_ts.tzinfo is None:
+        return max_ts.replace(tzinfo=dt.timezone.utc)
+    return max_ts
 
 def get_store_timezone(sess: Session, store_id: str):
     tz = sess.execute(
@@ -25,16 +38,24 @@ def get_store_timezone(sess: Session, store_id: str):
     ).scalar_one_or_none()
     if not tz:
         tz = DEFAULT_TZ
-    return pytz.timezone(tz)
+    return timezone_for(tz)
+
+@lru_cache(maxsize=512)
+def timezone_for(name: str):
+    return ZoneInfo(name)
 
 def get_business_hours(sess: Session, store_id: str) -> List[Tuple[int, dt.time, dt.time]]:
     recs = sess.execute(
         select(BusinessHours.day_of_week, BusinessHours.start_time_local, BusinessHours.end_time_local)
         .where(BusinessHours.store_id == store_id)
     ).all()
+    return rules_from_records(recs)
+
+def rules_from_records(recs) -> List[Tuple[int, dt.time, dt.time]]:
+    """(day_of_week, "HH:MM:SS", "HH:MM:SS") rows -> parsed rules; no rows means open 24/7."""
     if not recs:
         return [(dow, dt.time(0,0,0), dt.time(0,0,0)) for dow in range(7)]
-    return [(dow, _parse_hhmmss(s), _parse_hhmmss(e)) for dow, s, e in recs]
+    return [(int(dow), _parse_hhmmss(s), _parse_hhmmss(e)) for dow, s, e in recs]
 
 def window_ranges(now: dt.datetime):
     return {
@@ -48,92 +69,304 @@ def fetch_status_points(sess: Session, store_id: str, start: dt.datetime, end: d
         select(StoreStatus.timestamp_utc, StoreStatus.status)
         .where(StoreStatus.store_id == store_id)
         .where(StoreStatus.timestamp_utc <= end)
-        .order_by(StoreStatus.timestamp_utc.asc())
+        # id breaks timestamp ties in insertion order, so "last row wins" is well defined.
+        .order_by(StoreStatus.timestamp_utc.asc(), StoreStatus.id.asc())
     )
-    points = [(ts.astimezone(dt.timezone.utc), status) for ts, status in sess.execute(q).all()]
-    return points
-
-def interpolate_segments(points, start: dt.datetime, end: dt.datetime):
-    if start >= end:
-        return []
-    prior = None
-    for ts, st in points:
-        if ts <= start:
-            prior = (ts, st)
-        else:
-            break
-    if prior is None:
-        future = next((p for p in points if p[0] >= start), None)
-        base_status = future[1] if future else "inactive"
+    rows = sess.execute(q).all()
+    # SQLite drops tzinfo on the way back; values were written as UTC, so just tag them.
+    if rows and rows[0][0].tzinfo is None:
+        return [(ts.replace(tzinfo=dt.timezone.utc), status) for ts, status in rows]
+    return [tuple(r) for r in rows]
+
+def points_to_arrays(points) -> Tuple[np.ndarray, np.ndarray]:
+    """[(aware ts, status), ...] -> (int64 epoch-ns timestamps, bool active)."""
+    ts = to_epoch_ns(p[0] for p in points)
+    active = np.fromiter((p[1] == "active" for p in points), dtype=bool, count=len(ts))
+    return ts, active
+
+def _interpolate_np(ts, active, start_ns: int, end_ns: int):
+    """
+    Carry-forward status over [start_ns, end_ns) on time-sorted SoA points.
+    The status at start is the last point at or before it (else the first
+    later point, else inactive); each later point within the window opens a
+    new segment, and for duplicate timestamps the last one wins.
+    Returns (seg_starts, seg_ends, seg_active).
+    """
+    if start_ns >= end_ns:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, bool)
+    lo = np.searchsorted(ts, start_ns, side="right")
+    hi = np.searchsorted(ts, end_ns, side="left")
+    if lo > 0:
+        base = active[lo - 1]
     else:
-        base_status = prior[1]
-
-    segs = []
-    cur_t = start
-    cur_status = base_status
-    for ts, st in points:
-        if ts <= start:
-            continue
-        if ts >= end:
-            break
-        if ts > cur_t:
-            segs.append((Interval(cur_t, ts), cur_status))
-            cur_t = ts
-            cur_status = st
-        else:
-            cur_status = st
-    if cur_t < end:
-        segs.append((Interval(cur_t, end), cur_status))
-    return segs
-
-def business_intervals_utc_for_range(store_id: str, sess: Session, start: dt.datetime, end: dt.datetime):
-    tz = get_store_timezone(sess, store_id)
-    rules = get_business_hours(sess, store_id)
-    out = []
-    cur_local_date = start.astimezone(tz).date()
-    end_local_date = (end - dt.timedelta(seconds=1)).astimezone(tz).date()
+        base = bool(active[0]) if len(ts) else False
+
+    inner_ts = ts[lo:hi]
+    inner_active = active[lo:hi]
+    last_of_run = np.ones(len(inner_ts), dtype=bool)
+    last_of_run[:-1] = inner_ts[1:] != inner_ts[:-1]
+    change_ts = inner_ts[last_of_run]
+
+    bounds = np.concatenate(([start_ns], change_ts, [end_ns]))
+    seg_active = np.concatenate(([base], inner_active[last_of_run]))
+    return bounds[:-1], bounds[1:], seg_active
+
+def business_intervals_by_date(rules, tz, start: dt.datetime, end: dt.datetime) -> Dict[dt.date, List[Interval]]:
+    """Unclipped UTC business intervals for every local date touched by [start, end)."""
+    by_weekday: Dict[int, List[Tuple[int, dt.time, dt.time]]] = {}
+    for rule in rules:
+        by_weekday.setdefault(rule[0], []).append(rule)
+    return {
+        day: local_business_intervals_utc(day, by_weekday.get(day.weekday(), []), tz)
+        for day in _local_dates(tz, start, end)
+    }
+
+def _first_local_date(start: dt.datetime, tz) -> dt.date:
+    return start.astimezone(tz).date()
+
+def _last_local_date(end: dt.datetime, tz) -> dt.date:
+    return (end - dt.timedelta(seconds=1)).astimezone(tz).date()
+
+def _local_dates(tz, start: dt.datetime, end: dt.datetime):
+    cur_local_date = _first_local_date(start, tz)
+    end_local_date = _last_local_date(end, tz)
     while cur_local_date <= end_local_date:
-        out.extend(local_business_intervals_utc(cur_local_date, rules, tz))
+        yield cur_local_date
         cur_local_date += dt.timedelta(days=1)
+
+def _clip_to_window(by_date: Dict[dt.date, List[Interval]], tz, start: dt.datetime, end: dt.datetime):
+    # by_date must cover [start, end); narrower windows reuse the widest window's dates.
     filtered = []
     window = Interval(start, end)
-    for iv in out:
-        inter = iv.intersect(window)
-        if inter:
-            filtered.append(inter)
+    for day in _local_dates(tz, start, end):
+        for iv in by_date[day]:
+            inter = iv.intersect(window)
+            if inter:
+                filtered.append(inter)
     return filtered
 
-def sum_overlap(segs, biz_intervals):
-    up = 0.0
-    down = 0.0
-    for b in biz_intervals:
-        for seg, st in segs:
-            inter = seg.intersect(b)
-            if not inter:
-                continue
-            dur = inter.duration_seconds()
-            if st == "active":
-                up += dur
-            else:
-                down += dur
-    return up, down
+def _cumulative_at(t, seg_s, seg_e, cum, weight):
+    # Time covered by weighted segments in (-inf, t], for every t at once.
+    k = np.searchsorted(seg_s, t, side="right") - 1
+    kk = np.clip(k, 0, len(seg_s) - 1)
+    inside = np.clip(t - seg_s[kk], 0, seg_e[kk] - seg_s[kk]) * weight[kk]
+    return np.where(k >= 0, cum[kk] + inside, 0)
+
+def _sum_overlap_np(seg_s, seg_e, active, biz_s, biz_e):
+    """
+    Total (up, down) ns of disjoint, time-ordered status segments inside business
+    intervals, all as int64 epoch-ns arrays. Each business interval contributes U(end) - U(start), where U is the running up (or down) time, so
+    the cost is O((B + S) log S) instead of one intersection per pair.
+    """
+    if len(seg_s) == 0 or len(biz_s) == 0:
+        return 0, 0
+    dur = seg_e - seg_s
+    totals = []
+    for weight in (active.astype(np.int64), (~active).astype(np.int64)):
+        cum = np.concatenate(([0], np.cumsum(dur * weight)[:-1]))
+        hi = _cumulative_at(biz_e, seg_s, seg_e, cum, weight)
+        lo = _cumulative_at(biz_s, seg_s, seg_e, cum, weight)
+        totals.append(int(np.maximum(hi - lo, 0).sum()))
+    return totals[0], totals[1]
 
 def compute_store_metrics(sess: Session, store_id: str):
     now = get_now(sess)
     windows = window_ranges(now)
-    results = {"store_id": store_id}
     points = fetch_status_points(sess, store_id, min(w[0] for w in windows.values()), now)
+    tz = get_store_timezone(sess, store_id)
+    rules = get_business_hours(sess, store_id)
+    ts, active = points_to_arrays(points)
+    return dict(zip(REPORT_COLUMNS, _metrics_for_store(store_id, ts, active, rules, tz, now)))
+
+def _metrics_for_store(store_id: str, ts, active, rules, tz, now: dt.datetime) -> tuple:
+    windows = window_ranges(now)
+    up = {}
+    down = {}
+    # Localize each business day once; last_day/last_hour are sub-ranges of last_week.
+    by_date = business_intervals_by_date(rules, tz, min(w[0] for w in windows.values()), now)
 
     for key, (ws, we) in windows.items():
-        segs = interpolate_segments(points, ws, we)
-        biz = business_intervals_utc_for_range(store_id, sess, ws, we)
-        up_s, down_s = sum_overlap(segs, biz)
-
-        if key == "last_hour":
-            results["uptime_last_hour_minutes"] = round(up_s / 60.0, 2)
-            results["downtime_last_hour_minutes"] = round(down_s / 60.0, 2)
-        else:
-            results[f"uptime_{key}_hours"] = round(up_s / 3600.0, 2)
-            results[f"downtime_{key}_hours"] = round(down_s / 3600.0, 2)
-
-    return results
+        ws_ns, we_ns = to_epoch_ns([ws, we])
+        seg_s, seg_e, seg_active = _interpolate_np(ts, active, int(ws_ns), int(we_ns))
+        biz_s, biz_e = intervals_to_arrays(_clip_to_window(by_date, tz, ws, we))
+        up_ns, down_ns = _sum_overlap_np(seg_s, seg_e, seg_active, biz_s, biz_e)
+
+        # last_hour is reported in minutes, the longer windows in hours
+        unit_ns = 60e9 if key == "last_hour" else 3600e9
+        up[key] = round(up_ns / unit_ns, 2)
+        down[key] = round(down_ns / unit_ns, 2)
+
+    return (
+        store_id,
+        up["last_hour"], up["last_day"], up["last_week"],
+        down["last_hour"], down["last_day"], down["last_week"],
+    )
+
+# ----------------- Whole-report pipeline -----------------
+# Same numbers as calling compute_store_metrics for every store, but computed for
+# all stores at once on flat int64 columns instead of per-store Python loops.
+
+_WINDOW_UNIT_NS = {"last_hour": 60 * 10**9, "last_day": 3600 * 10**9, "last_week": 3600 * 10**9}
+
+def compute_report_frame(status_df, bh_df, tz_df, store_ids, now: dt.datetime) -> pd.DataFrame:
+    """
+    status_df: (store_id, timestamp_utc [tz-aware], status) ordered by timestamp_utc.
+    bh_df: (store_id, day_of_week, start_time_local, end_time_local).
+    tz_df: (store_id, timezone_str).
+    Returns one row per store (sorted by id) with REPORT_COLUMNS.
+    """
+    store_ids = sorted(store_ids, key=str)
+    if not store_ids:
+        return pd.DataFrame(columns=list(REPORT_COLUMNS))
+    tz_by_store = dict(zip(tz_df["store_id"], tz_df["timezone_str"]))
+    stores = pd.DataFrame({
+        "store_id": store_ids,
+        "tz": [tz_by_store.get(sid) or DEFAULT_TZ for sid in store_ids],
+    })
+
+    biz = _business_windows_frame(stores, bh_df, now)
+    knots = _StatusKnots(status_df)
+    up = knots.active_ns_at(biz["store_id"], biz["end_ns"]) - knots.active_ns_at(biz["store_id"], biz["start_ns"])
+    biz["up_ns"] = up
+    biz["down_ns"] = (biz["end_ns"] - biz["start_ns"]).to_numpy() - up
+
+    totals = biz.groupby(["store_id", "window"])[["up_ns", "down_ns"]].sum().unstack("window")
+    totals = totals.reindex(store_ids)
+
+    out = {"store_id": store_ids}
+    for kind, col in (("uptime", "up_ns"), ("downtime", "down_ns")):
+        for key, unit_ns in _WINDOW_UNIT_NS.items():
+            name = f"{kind}_{key}_{'minutes' if key == 'last_hour' else 'hours'}"
+            values = totals[(col, key)] if (col, key) in totals.columns else pd.Series(0, index=totals.index)
+            # tolist() -> Python ints/floats, so round() matches the per-store path exactly
+            out[name] = [round(v / unit_ns, 2) for v in values.fillna(0).tolist()]
+    return pd.DataFrame(out, columns=list(REPORT_COLUMNS))
+
+def _business_windows_frame(stores: pd.DataFrame, bh_df, now: dt.datetime) -> pd.DataFrame:
+    """
+    Long frame (store_id, window, start_ns, end_ns): every business interval of every
+    store, expanded over the local dates each window touches and clipped to the window.
+    """
+    windows = window_ranges(now)
+    week_start = min(w[0] for w in windows.values())
+
+    # Rules per store; stores without any rows are open 24/7 (see rules_from_records).
+    bh = bh_df[bh_df["store_id"].isin(stores["store_id"])]
+    parsed = {v: _parse_hhmmss(v) for v in pd.unique(pd.concat([bh["start_time_local"], bh["end_time_local"]]))}
+    rules = pd.DataFrame({
+        "store_id": bh["store_id"].to_numpy(),
+        "weekday": bh["day_of_week"].astype(int).to_numpy(),
+        "start_t": bh["start_time_local"].map(parsed).to_numpy(),
+        "end_t": bh["end_time_local"].map(parsed).to_numpy(),
+    })
+    missing = stores.loc[~stores["store_id"].isin(rules["store_id"]), "store_id"]
+    if len(missing):
+        default = pd.DataFrame(
+            [(sid, *rule) for sid in missing for rule in rules_from_records([])],
+            columns=rules.columns,
+        )
+        rules = pd.concat([rules, default], ignore_index=True)
+    rules = rules.merge(stores, on="store_id")
+
+    # Local dates per timezone for the widest window, plus each window's date span.
+    dates = []
+    spans = []
+    for tz_name in stores["tz"].unique():
+        tz = timezone_for(tz_name)
+        dates.extend((tz_name, day, day.weekday()) for day in _local_dates(tz, week_start, now))
+        for key, (ws, we) in windows.items():
+            spans.append((tz_name, key, _first_local_date(ws, tz), _last_local_date(we, tz)))
+    dates = pd.DataFrame(dates, columns=["tz", "local_date", "weekday"])
+    spans = pd.DataFrame(spans, columns=["tz", "window", "first_date", "last_date"])
+
+    biz = rules.merge(dates, on=["tz", "weekday"])
+    if biz.empty:
+        return pd.DataFrame({"store_id": [], "window": [], "start_ns": np.empty(0, np.int64), "end_ns": np.empty(0, np.int64)})
+    # Localize each distinct (tz, date, time) once; many stores share them.
+    biz["start_ns"] = _local_to_epoch_ns(biz["tz"], biz["local_date"], biz["start_t"], np.zeros(len(biz), bool))
+    biz["end_ns"] = _local_to_epoch_ns(biz["tz"], biz["local_date"], biz["end_t"], (biz["end_t"] <= biz["start_t"]).to_numpy())
+
+    biz = biz.merge(spans, on="tz")
+    biz = biz[(biz["local_date"] >= biz["first_date"]) & (biz["local_date"] <= biz["last_date"])]
+    bounds = {key: to_epoch_ns([ws, we]) for key, (ws, we) in windows.items()}
+    ws_ns = biz["window"].map(lambda k: bounds[k][0]).to_numpy(np.int64)
+    we_ns = biz["window"].map(lambda k: bounds[k][1]).to_numpy(np.int64)
+    start_ns = np.maximum(biz["start_ns"].to_numpy(np.int64), ws_ns)
+    end_ns = np.minimum(biz["end_ns"].to_numpy(np.int64), we_ns)
+    keep = start_ns < end_ns
+    return pd.DataFrame({
+        "store_id": biz["store_id"].to_numpy()[keep],
+        "window": biz["window"].to_numpy()[keep],
+        "start_ns": start_ns[keep],
+        "end_ns": end_ns[keep],
+    })
+
+def _local_to_epoch_ns(tz_names, local_dates, times, next_day) -> np.ndarray:
+    keys = pd.DataFrame({"tz": tz_names.to_numpy(), "day": local_dates.to_numpy(), "t": times.to_numpy(), "next": next_day})
+    uniq = keys.drop_duplicates()
+    uniq = uniq.assign(ns=to_epoch_ns(
+        dt.datetime.combine(day + dt.timedelta(days=1) if nxt else day, t, tzinfo=timezone_for(tz))
+        for tz, day, t, nxt in zip(uniq["tz"], uniq["day"], uniq["t"], uniq["next"])
+    ))
+    return keys.merge(uniq, on=["tz", "day", "t", "next"], how="left")["ns"].to_numpy(np.int64)
+
+class _StatusKnots:
+    """
+    Per-store status step functions, flattened. The status at time t is that of the
+    last point at or before t (duplicate timestamps: last one wins), or of the
+    store's first row if t precedes every point -- the same rule _interpolate_np
+    applies inside every window. active_ns_at(t) is the active time accumulated from
+    the store's first point up to t (negative before it), so
+    active_ns_at(end) - active_ns_at(start) is the uptime in [start, end).
+    """
+
+    def __init__(self, status_df):
+        pts = pd.DataFrame({
+            "store_id": status_df["store_id"].to_numpy(),
+            "t": status_df["timestamp_utc"].astype("int64").to_numpy(),
+            "a": (status_df["status"] == "active").to_numpy(np.int64),
+        })
+        # Backfill before a store's first timestamp uses the first row there, not the last.
+        backfill = dict(pts.drop_duplicates("store_id", keep="first")[["store_id", "a"]].itertuples(index=False, name=None))
+        pts = pts.drop_duplicates(["store_id", "t"], keep="last")
+        pts = pts.sort_values(["store_id", "t"], kind="stable").reset_index(drop=True)
+        sid = pts["store_id"].to_numpy()
+        t = pts["t"].to_numpy()
+        a = pts["a"].to_numpy()
+        n = len(pts)
+
+        first = np.ones(n, dtype=bool)
+        first[1:] = sid[1:] != sid[:-1]
+        dur = np.zeros(n, dtype=np.int64)
+        dur[:-1] = np.where(first[1:], 0, t[1:] - t[:-1])
+        contrib = dur * a
+        excl = np.cumsum(contrib) - contrib
+        group_start = np.maximum.accumulate(np.where(first, np.arange(n), 0)) if n else np.empty(0, np.int64)
+
+        self.sid = sid
+        self.t = t
+        self.a = a
+        self.cum = excl - excl[group_start]
+        self.first_index = dict(zip(sid[first], np.flatnonzero(first)))
+        self.backfill_a = a.copy()
+        self.backfill_a[first] = [backfill[x] for x in sid[first]]
+        # merge_asof wants the right side ordered by its "on" key; sort once, query many times.
+        self.frame = pd.DataFrame({"store_id": sid, "kt": t, "ki": np.arange(n)}).sort_values("kt", kind="stable")
+
+    def active_ns_at(self, store_ids, t) -> np.ndarray:
+        t = np.asarray(t, dtype=np.int64)
+        if len(self.t) == 0 or len(t) == 0:
+            return np.zeros(len(t), dtype=np.int64)
+        q = pd.DataFrame({"store_id": np.asarray(store_ids), "qt": t, "qi": np.arange(len(t))})
+        m = pd.merge_asof(
+            q.sort_values("qt", kind="stable"), self.frame,
+            left_on="qt", right_on="kt", by="store_id", direction="backward",
+        ).sort_values("qi")
+        ki = m["ki"].to_numpy()
+        before_first = np.isnan(ki)
+        fallback = m["store_id"].map(self.first_index).to_numpy(dtype=float)
+        ki = np.where(before_first, fallback, ki)
+        has_points = ~np.isnan(ki)
+        k = np.where(has_points, ki, 0).astype(np.int64)
+        a = np.where(before_first, self.backfill_a[k], self.a[k])
+        return np.where(has_points, self.cum[k] + (t - self.t[k]) * a, 0)
@@ -2,7 +2,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import List, Tuple
 import datetime as dt
-import pytz
+import numpy as np
 
 WEEKDAYS = list(range(7))  # 0=Monday ... 6=Sunday
 
@@ -21,6 +21,17 @@ class Interval:
             return None
         return Interval(s, e)
 
+_EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+_ONE_US = dt.timedelta(microseconds=1)
+
+def to_epoch_ns(values) -> np.ndarray:
+    """Aware datetimes -> int64 nanoseconds since the UNIX epoch (microsecond resolution)."""
+    return np.fromiter(((v - _EPOCH) // _ONE_US * 1000 for v in values), dtype=np.int64)
+
+def intervals_to_arrays(intervals: List[Interval]) -> Tuple[np.ndarray, np.ndarray]:
+    """Struct-of-arrays view of intervals: (starts_ns, ends_ns) as int64 epoch nanoseconds."""
+    return to_epoch_ns(iv.start for iv in intervals), to_epoch_ns(iv.end for iv in intervals)
+
 def make_utc(dt_like: dt.datetime) -> dt.datetime:
     if dt_like.tzinfo is None:
         raise ValueError("Naive datetime not allowed")
@@ -29,13 +40,13 @@ def make_utc(dt_like: dt.datetime) -> dt.datetime:
 def local_business_intervals_utc(
     day: dt.date,
     biz_hours_local: List[Tuple[int, dt.time, dt.time]],
-    tz: pytz.BaseTzInfo,
+    tz: dt.tzinfo,
 ) -> List[Interval]:
     """
     For a given calendar date (day) and a list of business hours tuples
     (dayOfWeek, start_time_local, end_time_local), produce UTC intervals that
     fall on that date *in local time*.
-    Handles cross-midnight by splitting into two dates.
+    Cross-midnight hours become a single interval ending on the next date.
     """
     out: List[Interval] = []
     local = tz
@@ -44,23 +55,15 @@ def local_business_intervals_utc(
         if day.weekday() != dow:
             continue
         # Construct start/end in local tz for this 'day'
-        start_local = local.localize(dt.datetime.combine(day, start_t))
-        end_local = local.localize(dt.datetime.combine(day, end_t))
-
+        start_local = dt.datetime.combine(day, start_t, tzinfo=local)
+        end_local = dt.datetime.combine(day, end_t, tzinfo=local)
         if end_t <= start_t:
-            # Crosses midnight -> split into [start, day_end) and [day_start_next, end_next)
-            end_of_day_local = local.localize(dt.datetime.combine(day, dt.time(23, 59, 59, 999999)))
-            start_of_next_local = local.localize(dt.datetime.combine(day + dt.timedelta(days=1), dt.time(0, 0)))
-            first = (start_local, end_of_day_local + dt.timedelta(microseconds=1))
-            second = (start_of_next_local, end_local + dt.timedelta(days=1))
-            parts = [first, second]
-        else:
-            parts = [(start_local, end_local)]
+            # Crosses midnight -> one interval running into the next day; callers clip to their window
+            end_local += dt.timedelta(days=1)
 
-        for s_local, e_local in parts:
-            s_utc = s_local.astimezone(dt.timezone.utc)
-            e_utc = e_local.astimezone(dt.timezone.utc)
-            out.append(Interval(s_utc, e_utc))
+        s_utc = start_local.astimezone(dt.timezone.utc)
+        e_utc = end_local.astimezone(dt.timezone.utc)
+        out.append(Interval(s_utc, e_utc))
 
     return out
 
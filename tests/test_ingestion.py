@@ -0,0 +1,68 @@
+from __future__ import annotations
+import datetime as dt
+
+from sqlalchemy import inspect, select
+
+from app.ingestion import (
+    get_engine, init_db, upgrade_schema, _parse_utc,
+    ingest_store_status, ingest_business_hours, ingest_store_timezones,
+)
+from app.models import Store, StoreStatus, BusinessHours, StoreTimeZone
+
+UTC = dt.timezone.utc
+
+def test_store_ids_are_kept_as_text_on_every_path(tmp_path):
+    (tmp_path / "status.csv").write_text(
+        "store_id,status,timestamp_utc\n"
+        "007,active,2024-10-03 23:33:20.412748 UTC\n"
+    )
+    (tmp_path / "hours.csv").write_text(
+        "store_id,dayOfWeek,start_time_local,end_time_local\n"
+        " 007,1,09:00:00,17:00:00\n"
+    )
+    (tmp_path / "tz.csv").write_text("store_id,timezone_str\n007,America/Boise\n")
+    engine = get_engine("sqlite://")
+    init_db(engine)
+    ingest_store_status(str(tmp_path / "status.csv"), engine)
+    ingest_business_hours(str(tmp_path / "hours.csv"), engine)
+    ingest_store_timezones(str(tmp_path / "tz.csv"), engine)
+
+    with engine.connect() as conn:
+        for column in (Store.store_id, StoreStatus.store_id, BusinessHours.store_id, StoreTimeZone.store_id):
+            assert conn.execute(select(column)).scalars().all() == ["007"]
+
+def test_parse_utc_formats():
+    assert _parse_utc("2024-10-03 23:34:06.15508 UTC") == dt.datetime(2024, 10, 3, 23, 34, 6, 155080, tzinfo=UTC)
+    assert _parse_utc("2024-10-03 23:34:06.1 UTC") == dt.datetime(2024, 10, 3, 23, 34, 6, 100000, tzinfo=UTC)
+    assert _parse_utc("2024-10-03 23:34:06 UTC") == dt.datetime(2024, 10, 3, 23, 34, 6, tzinfo=UTC)
+    assert _parse_utc("2024-10-03T23:34:06.412748Z") == dt.datetime(2024, 10, 3, 23, 34, 6, 412748, tzinfo=UTC)
+    assert _parse_utc("2024-10-03T18:34:06-05:00") == dt.datetime(2024, 10, 3, 23, 34, 6, tzinfo=UTC)
+
+def test_upgrade_schema_replaces_pre_covering_indexes():
+    engine = get_engine("sqlite://")
+    with engine.begin() as conn:
+        # store_status as created before ix_store_ts_status existed.
+        conn.exec_driver_sql(
+            "CREATE TABLE store_status (id INTEGER PRIMARY KEY, store_id VARCHAR, "
+            "timestamp_utc DATETIME, status VARCHAR)"
+        )
+        conn.exec_driver_sql("CREATE INDEX ix_store_status_store_id ON store_status (store_id)")
+        conn.exec_driver_sql("CREATE INDEX ix_store_ts ON store_status (store_id, timestamp_utc)")
+    init_db(engine)
+    upgrade_schema(engine)
+    upgrade_schema(engine)  # idempotent: runs on every start
+
+    names = {ix["name"] for ix in inspect(engine).get_indexes("store_status")}
+    assert names == {"ix_store_ts_status", "ix_store_status_timestamp_utc"}
+
+def test_upgrade_schema_adds_new_report_columns():
+    engine = get_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE reports (id INTEGER PRIMARY KEY, report_id VARCHAR, status VARCHAR, "
+            "created_at DATETIME, finished_at DATETIME, path TEXT)"
+        )
+    init_db(engine)
+    upgrade_schema(engine)
+
+    assert "started_at" in {c["name"] for c in inspect(engine).get_columns("reports")}
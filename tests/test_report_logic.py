@@ -0,0 +1,104 @@
+from __future__ import annotations
+import datetime as dt
+import random
+
+import pandas as pd
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.ingestion import get_engine, init_db
+from app.models import StoreStatus, BusinessHours, StoreTimeZone
+from app.report_logic import REPORT_COLUMNS, compute_report_frame, compute_store_metrics
+
+UTC = dt.timezone.utc
+# US DST starts 2024-03-10 02:00 local, inside the last_week window ending here.
+NOW = dt.datetime(2024, 3, 12, 15, 30, tzinfo=UTC)
+
+STORES = {
+    # store_id: (timezone or None, [(day_of_week, start, end), ...], has status rows)
+    "chicago_9to5": ("America/Chicago", [(d, "09:00:00", "17:00:00") for d in range(7)], True),
+    "ny_overnight": ("America/New_York", [(d, "22:00:00", "02:00:00") for d in range(7)], True),
+    "la_24x7": ("America/Los_Angeles", [], True),
+    "default_tz": (None, [(0, "10:00:00", "14:00:00"), (4, "18:00:00", "23:30:00")], True),
+    "no_status": ("America/Denver", [(d, "08:00:00", "20:00:00") for d in range(5)], False),
+}
+
+def _status_rows(seed: int = 7):
+    rng = random.Random(seed)
+    rows = []
+    for sid, (_, _, has_status) in STORES.items():
+        if not has_status:
+            continue
+        t = NOW - dt.timedelta(days=8)
+        while t < NOW:
+            rows.append((sid, t, rng.choice(("active", "inactive"))))
+            if rng.random() < 0.2:
+                # Duplicate timestamp with the opposite status; the later row must win.
+                rows.append((sid, t, "inactive" if rows[-1][2] == "active" else "active"))
+            t += dt.timedelta(minutes=rng.randint(20, 120))
+    rows.append(("chicago_9to5", NOW, "active"))
+    return rows
+
+@pytest.fixture()
+def engine():
+    engine = get_engine("sqlite://")
+    init_db(engine)
+    with Session(engine) as sess, sess.begin():
+        sess.add_all(StoreStatus(store_id=s, timestamp_utc=t, status=st) for s, t, st in _status_rows())
+        for sid, (tz, hours, _) in STORES.items():
+            if tz:
+                sess.add(StoreTimeZone(store_id=sid, timezone_str=tz))
+            sess.add_all(
+                BusinessHours(store_id=sid, day_of_week=d, start_time_local=s, end_time_local=e)
+                for d, s, e in hours
+            )
+    return engine
+
+def _report_frame(engine):
+    # Same reads as main.run_report.
+    status_df = pd.read_sql(
+        select(StoreStatus.store_id, StoreStatus.timestamp_utc, StoreStatus.status)
+        .order_by(StoreStatus.timestamp_utc.asc(), StoreStatus.id.asc()),
+        engine,
+    )
+    bh_df = pd.read_sql(
+        select(BusinessHours.store_id, BusinessHours.day_of_week,
+               BusinessHours.start_time_local, BusinessHours.end_time_local),
+        engine,
+    )
+    tz_df = pd.read_sql(select(StoreTimeZone.store_id, StoreTimeZone.timezone_str), engine)
+    status_df["timestamp_utc"] = pd.to_datetime(status_df["timestamp_utc"], utc=True)
+    return compute_report_frame(status_df, bh_df, tz_df, list(STORES), NOW)
+
+def test_report_frame_matches_per_store_metrics(engine):
+    frame = _report_frame(engine)
+    assert list(frame.columns) == list(REPORT_COLUMNS)
+    assert frame["store_id"].tolist() == sorted(STORES)
+    with Session(engine) as sess:
+        for row in frame.to_dict("records"):
+            assert row == compute_store_metrics(sess, row["store_id"])
+
+def test_store_without_status_rows_is_down_all_week(engine):
+    row = _report_frame(engine).set_index("store_id").loc["no_status"]
+    assert row["uptime_last_week_hours"] == 0.0
+    # Mon-Fri 08:00-20:00 Denver over Tue 08:30 MST .. next Tue 09:30 MDT: 11.5 + 3*12 + 12 + 1.5.
+    assert row["downtime_last_week_hours"] == 61.0
+
+def test_duplicate_timestamp_last_row_wins():
+    engine = get_engine("sqlite://")
+    init_db(engine)
+    t = NOW - dt.timedelta(hours=2)
+    with Session(engine) as sess, sess.begin():
+        sess.add_all([
+            StoreStatus(store_id="s", timestamp_utc=t, status="active"),
+            StoreStatus(store_id="s", timestamp_utc=t, status="inactive"),
+            StoreStatus(store_id="s", timestamp_utc=t + dt.timedelta(hours=1), status="active"),
+            StoreStatus(store_id="s", timestamp_utc=t + dt.timedelta(hours=1), status="inactive"),
+            StoreStatus(store_id="s", timestamp_utc=NOW, status="active"),
+        ])
+    with Session(engine) as sess:
+        metrics = compute_store_metrics(sess, "s")
+    assert metrics["uptime_last_hour_minutes"] == 0.0
+    assert metrics["downtime_last_hour_minutes"] == 60.0
+